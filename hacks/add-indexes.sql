@@ -0,0 +1,19 @@
+-- Lookups by playlist_id on playlists_tracks, by track_id on tracks_artists, by artist_id on
+-- artists_genres and by album_id on albums_artists are already served by the primary keys
+
+-- DROP INDEX ix_albums_tracks_track;
+CREATE INDEX IF NOT EXISTS ix_albums_tracks_track ON albums_tracks(track_id);
+
+-- DROP INDEX ix_playlists_tracks_track;
+CREATE INDEX IF NOT EXISTS ix_playlists_tracks_track ON playlists_tracks(track_id);
+
+-- DROP INDEX ix_albums_artists_artist;
+CREATE INDEX IF NOT EXISTS ix_albums_artists_artist ON albums_artists(artist_id);
+
+-- DROP INDEX ix_playlists_name;
+-- LIKE is case insensitive, so the index needs the NOCASE collation for playlists name patterns without
+-- a leading wildcard to be resolved with a range search, id makes it a covering index for the lookups
+CREATE INDEX IF NOT EXISTS ix_playlists_name ON playlists(name COLLATE NOCASE, id);
+
+-- refresh the query planner statistics so the indexes above are picked up
+ANALYZE;
@@ -6,6 +6,13 @@ CREATE TABLE IF NOT EXISTS playlists(
   updated_at TEXT NOT NULL
 );
 
+-- DROP TABLE playlists_snapshots;
+CREATE TABLE IF NOT EXISTS playlists_snapshots(
+  playlist_id TEXT PRIMARY KEY,
+  snapshot_id TEXT NOT NULL,
+  FOREIGN KEY (playlist_id) REFERENCES playlists (id)
+);
+
 -- DROP TABLE tracks;
 CREATE TABLE IF NOT EXISTS tracks(
   id TEXT PRIMARY KEY,
@@ -1,121 +1,151 @@
 import json
 import logging
+import os
+from collections import defaultdict
 from datetime import date
 from pathlib import Path
 
 from spotfm import utils
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 EXPORTS_PATH = Path.home() / ".spotfm" / "exports"
 
 
-def prepare_artists_queries(data):
+def prepare_artists_queries(data, updated_at):
     queries = []
     id = data["id"]
-    name = utils.sanitize_string(data["name"])
+    name = data["name"]
     genres = data["genres"]
-    updated_at = date.today()
 
-    artist_query = f"INSERT OR IGNORE INTO artists VALUES ('{id}', '{name}', '{updated_at}')"
+    artist_query = ("INSERT OR IGNORE INTO artists VALUES (?, ?, ?)", [(id, name, updated_at)])
     queries.append(artist_query)
 
     if len(genres) > 0:
-        values = ""
-        for genre in genres:
-            values += f"('{id}','{utils.sanitize_string(genre)}'),"
-        genre_query = f"INSERT OR IGNORE INTO artists_genres VALUES {values}".rstrip(",")
+        values = [(id, genre) for genre in genres]
+        genre_query = ("INSERT OR IGNORE INTO artists_genres VALUES (?, ?)", values)
         queries.append(genre_query)
     return queries
 
 
-def prepare_tracks_queries(data):
+def prepare_tracks_queries(data, updated_at):
     queries = []
     id = data["id"]
-    name = utils.sanitize_string(data["name"])
+    name = data["name"]
     artists = data["artists"]
-    updated_at = date.today()
 
-    track_query = f"INSERT OR IGNORE INTO tracks VALUES ('{id}', '{name}', '{updated_at}')"
+    track_query = ("INSERT OR IGNORE INTO tracks VALUES (?, ?, ?)", [(id, name, updated_at)])
     queries.append(track_query)
 
     if len(artists) > 0:
-        values = ""
-        for artist in artists:
-            artist_id = artist["id"]
-            values += f"('{id}','{artist_id}'),"
-        artists_query = f"INSERT OR IGNORE INTO tracks_artists VALUES {values}".rstrip(",")
+        values = [(id, artist["id"]) for artist in artists]
+        artists_query = ("INSERT OR IGNORE INTO tracks_artists VALUES (?, ?)", values)
         queries.append(artists_query)
     return queries
 
 
-def prepare_albums_queries(data):
+def prepare_albums_queries(data, updated_at):
     queries = []
     track_id = data["id"]
     album_id = data["album"]["id"]
-    album_name = utils.sanitize_string(data["album"]["name"])
+    album_name = data["album"]["name"]
     album_release_date = data["album"]["release_date"]
     album_artists = data["album"]["artists"]
-    updated_at = date.today()
 
     album_query = (
-        f"INSERT OR IGNORE INTO albums VALUES ('{album_id}', '{album_name}', '{album_release_date}', '{updated_at}')"
+        "INSERT OR IGNORE INTO albums VALUES (?, ?, ?, ?)",
+        [(album_id, album_name, album_release_date, updated_at)],
     )
     queries.append(album_query)
 
-    album_track_query = f"INSERT OR IGNORE INTO albums_tracks VALUES ('{album_id}','{track_id}')"
+    album_track_query = ("INSERT OR IGNORE INTO albums_tracks VALUES (?, ?)", [(album_id, track_id)])
     queries.append(album_track_query)
 
     if len(album_artists) > 0:
-        values = ""
-        for artist in album_artists:
-            artist_id = artist["id"]
-            values += f"('{album_id}','{artist_id}'),"
-        album_artists_query = f"INSERT OR IGNORE INTO albums_artists VALUES {values}".rstrip(",")
+        values = [(album_id, artist["id"]) for artist in album_artists]
+        album_artists_query = ("INSERT OR IGNORE INTO albums_artists VALUES (?, ?)", values)
         queries.append(album_artists_query)
     return queries
 
 
-def prepare_playlists_queries(data):
+def prepare_playlists_queries(data, updated_at):
     queries = []
     id = data["id"]
-    name = utils.sanitize_string(data["name"])
-    owner = utils.sanitize_string(data["owner"]["id"])
+    name = data["name"]
+    owner = data["owner"]["id"]
     tracks = data["tracks"]["items"]
-    updated_at = date.today()
-    playlist_query = f"INSERT OR IGNORE INTO playlists VALUES ('{id}', '{name}', '{owner}', '{updated_at}')"
+    playlist_query = ("INSERT OR IGNORE INTO playlists VALUES (?, ?, ?, ?)", [(id, name, owner, updated_at)])
     queries.append(playlist_query)
 
     if len(tracks) > 0:
-        values = ""
-        for track in tracks:
-            try:
-                track_id = track["track"]["id"]
-            except TypeError:
-                continue
-            added_date = track["added_at"]
-            values += f"('{id}','{track_id}', '{added_date}'),"
-        tracks_query = f"INSERT OR IGNORE INTO playlists_tracks VALUES {values}".rstrip(",")
+        values = [(id, track["track"]["id"], track["added_at"]) for track in tracks if track["track"] is not None]
+        tracks_query = ("INSERT OR IGNORE INTO playlists_tracks VALUES (?, ?, ?)", values)
         queries.append(tracks_query)
     return queries
 
 
+# Walk the export tree with os.scandir, whose entries cache the file type from the directory
+# listing instead of building and stat-ing a Path object per file like Path.rglob
+def iter_json_files(root):
+    # kinds without exports are skipped, as Path.rglob did
+    if not os.path.isdir(root):
+        return
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith(".json"):
+                    yield entry.path
+
+
+def load_json(json_file):
+    with open(json_file, "rb") as f:
+        if orjson is not None:
+            return orjson.loads(f.read())
+        return json.load(f)
+
+
 def import_json(kind):
+    # rows are accumulated per insert statement across all files then written with
+    # multi-row inserts per statement inside a single transaction
+    rows = defaultdict(list)
+    updated_at = str(date.today())
     export_path = EXPORTS_PATH / kind
-    for json_file in export_path.rglob("*.json"):
+    for json_file in iter_json_files(export_path):
         logging.info("importing %s", json_file)
 
-        with open(json_file) as f:
-            data = json.load(f)
+        data = load_json(json_file)
 
         match kind:
             case "artists":
-                queries = prepare_artists_queries(data)
+                queries = prepare_artists_queries(data, updated_at)
             case "tracks":
-                queries = prepare_tracks_queries(data)
-                queries = prepare_albums_queries(data)
+                queries = prepare_tracks_queries(data, updated_at) + prepare_albums_queries(data, updated_at)
             case "playlists":
-                queries = prepare_playlists_queries(data)
-
-        utils.query_db(utils.DATABASE, queries)
+                queries = prepare_playlists_queries(data, updated_at)
+
+        for query, values in queries:
+            rows[query].extend(values)
+
+    # secondary indexes of the loaded tables are dropped during the inserts and rebuilt once from the final data,
+    # all in the query_db transaction so a failed import keeps them
+    tables = [sql.partition(" INTO ")[2].split()[0] for sql in rows]
+    indexes = utils.select_db_in(
+        utils.DATABASE,
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ({})",
+        tables,
+    )
+    queries = [f"DROP INDEX {name}" for name, _ in indexes]
+    queries.extend(query for sql, values in rows.items() for query in utils.multi_row_insert(sql, values))
+    queries.extend(sql for _, sql in indexes)
+    utils.query_db(utils.DATABASE, queries)
+    # refresh the query planner statistics after the bulk insert
+    utils.query_db(utils.DATABASE, ["ANALYZE"])
 
 
 def main():
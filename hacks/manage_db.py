@@ -5,6 +5,7 @@ from pathlib import Path
 from spotfm import utils
 
 CREATE_TABLES_SCRIPT = Path("hacks") / "create-tables.sql"
+ADD_INDEXES_SCRIPT = Path("hacks") / "add-indexes.sql"
 TABLES = [
     "albums_artists",
     "albums_tracks",
@@ -13,30 +14,35 @@ TABLES = [
     "albums",
     "artists",
     "playlists",
+    "playlists_snapshots",
     "tracks",
 ]
 
 
 def clean_tables():
-    queries = []
-    for table in TABLES:
-        queries.append(f"DELETE FROM {table}")
+    queries = [f"DELETE FROM {table}" for table in TABLES]
     utils.query_db(utils.DATABASE, queries)
 
 
 def create_tables():
-    with open(CREATE_TABLES_SCRIPT) as f:
-        query_script = "".join(f.readlines())
+    query_script = CREATE_TABLES_SCRIPT.read_text()
+    utils.query_db(utils.DATABASE, [query_script], script=True)
+
+
+def add_indexes():
+    query_script = ADD_INDEXES_SCRIPT.read_text()
     utils.query_db(utils.DATABASE, [query_script], script=True)
 
 
 def main():
     logging.basicConfig(level=logging.DEBUG)
     parser = argparse.ArgumentParser(prog="manage-spotfm-db")
-    parser.add_argument("command", choices=["clean-tables", "create-tables"])
+    parser.add_argument("command", choices=["add-indexes", "clean-tables", "create-tables"])
     args = parser.parse_args()
 
     match args.command:
+        case "add-indexes":
+            add_indexes()
         case "clean-tables":
             clean_tables()
         case "create-tables":
@@ -100,11 +100,14 @@ def main():
 
     config = utils.parse_config()
 
-    match args.group:
-        case "lastfm":
-            lastfm_cli(args, config)
-        case "spotify":
-            spotify_cli(args, config)
+    try:
+        match args.group:
+            case "lastfm":
+                lastfm_cli(args, config)
+            case "spotify":
+                spotify_cli(args, config)
+    finally:
+        utils.close_connections()
 
 
 if __name__ == "__main__":
@@ -1,23 +1,53 @@
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 import pylast
 
+from spotfm import utils
+
 LASTFM_BASE_URL = "https://www.last.fm"
 PREDEFINED_PERIODS = [7, 30, 90, 180, 365]
+SECONDS_PER_DAY = 86400
+MAX_WORKERS = 5
+REQUESTS_INTERVAL = 0.2  # Last.fm allows 5 requests per second
+SCROBBLES_CACHE = utils.CACHE_DIR / "scrobbles.db"
+SCROBBLES_CACHE_TTL = 6 * 3600
 
 
 class UnknownPeriodError(Exception):
     pass
 
 
+# pylast network spacing out every request it sends, each page of a track scrobbles included, across all the
+# worker threads to stay under Last.fm rate limit, pylast own delay not being thread safe
+class LastFMNetwork(pylast.LastFMNetwork):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._requests_lock = threading.Lock()
+        self._next_request = 0.0
+
+    def _delay_call(self):
+        with self._requests_lock:
+            now = time.monotonic()
+            delay = self._next_request - now
+            self._next_request = max(now, self._next_request) + REQUESTS_INTERVAL
+        if delay > 0:
+            time.sleep(delay)
+
+
 class Client:
     def __init__(self, api_key, api_secret, username, password_hash):
-        self.client = pylast.LastFMNetwork(
+        self.client = LastFMNetwork(
             api_key=api_key,
             api_secret=api_secret,
             username=username,
             password_hash=password_hash,
         )
+        # pylast only calls _delay_call before each request when rate limiting is enabled
+        self.client.enable_rate_limit()
 
 
 class Track:
@@ -26,23 +56,27 @@ class Track:
         self.title = title
         self.url = url
         self.user = user
+        self._scrobbles_cache = None  # [timestamp]
 
     def __str__(self):
         return f"{self.artist[0:50]} - {self.title[0:50]}"
 
     @property
     def scrobbles(self):
-        return self.user.get_track_scrobbles(self.artist, self.title)
+        if self._scrobbles_cache is None:
+            scrobbles = self.user.get_track_scrobbles(self.artist, self.title)
+            self._scrobbles_cache = [int(scrobble.timestamp) for scrobble in scrobbles]
+        return self._scrobbles_cache
 
     def get_scrobbles_count(self, period=None):
-        now = datetime.now()
-        scrobbles_ts = []
+        # compare raw unix timestamps instead of building a datetime per scrobble
+        now_ts = int(datetime.now().timestamp())
+        period_secs = period * SECONDS_PER_DAY if period is not None else None
+        scrobbles_count = 0
         for scrobble in self.scrobbles:
-            timestamp = datetime.fromtimestamp(int(scrobble.timestamp))
-            delta = now - timestamp
-            if period is None or delta.days < period:
-                scrobbles_ts.append(timestamp)
-        return len(scrobbles_ts)
+            if period_secs is None or now_ts - scrobble < period_secs:
+                scrobbles_count += 1
+        return scrobbles_count
 
     def get_scrobbles_url(self, period=None):
         try:
@@ -54,6 +88,55 @@ class Track:
         return url
 
 
+def create_scrobbles_cache():
+    SCROBBLES_CACHE.parent.mkdir(parents=True, exist_ok=True)
+    # the cache can be rebuilt from Last.fm, so writes don't need to wait for the disk, the safety level
+    # can't be changed inside the transaction of query_db
+    utils.select_db(SCROBBLES_CACHE, "PRAGMA synchronous=OFF")
+    utils.query_db(
+        SCROBBLES_CACHE,
+        [
+            # scrobbles are a play history of the user, so each user has its own entries
+            "CREATE TABLE IF NOT EXISTS scrobbles("
+            "user TEXT NOT NULL, artist TEXT NOT NULL, title TEXT NOT NULL, fetched_at INTEGER NOT NULL, "
+            "payload BLOB NOT NULL, PRIMARY KEY (user, artist, title))",
+        ],
+    )
+
+
+# Return the cached scrobbles timestamps of the user tracks fetched less than SCROBBLES_CACHE_TTL ago, looking
+# up only the requested tracks on the primary key by chunks staying under sqlite limit of bound parameters
+def load_cached_scrobbles(user, tracks):
+    fetched_after = int(time.time()) - SCROBBLES_CACHE_TTL
+    keys = list(dict.fromkeys((track.artist, track.title) for track in tracks))
+    chunk_size = (utils.SQLITE_MAX_VARIABLES - 2) // 2
+    cached = {}
+    for i in range(0, len(keys), chunk_size):
+        chunk = keys[i : i + chunk_size]
+        rows = utils.select_db(
+            SCROBBLES_CACHE,
+            f"""
+            WITH keys(artist, title) AS (VALUES {", ".join(["(?, ?)"] * len(chunk))})
+            SELECT s.artist, s.title, s.payload
+            FROM keys JOIN scrobbles s ON s.user = ? AND s.artist = keys.artist AND s.title = keys.title
+            WHERE s.fetched_at > ?
+            """,
+            (*(value for key in chunk for value in key), user, fetched_after),
+        )
+        for artist, title, payload in rows:
+            timestamps = array("q")
+            timestamps.frombytes(payload)
+            cached[(artist, title)] = timestamps.tolist()
+    return cached
+
+
+# Timestamps are stored as packed 64-bit integers, which load without unpickling any object
+def save_cached_scrobbles(user, tracks):
+    fetched_at = int(time.time())
+    rows = [(user, track.artist, track.title, fetched_at, array("q", track.scrobbles).tobytes()) for track in tracks]
+    utils.query_db(SCROBBLES_CACHE, [("INSERT OR REPLACE INTO scrobbles VALUES (?, ?, ?, ?, ?)", rows)])
+
+
 class User:
     def __init__(self, client):
         self.user = client.get_authenticated_user()
@@ -62,7 +145,8 @@ class User:
         if period not in PREDEFINED_PERIODS:
             raise UnknownPeriodError(f"period shoud be part of {PREDEFINED_PERIODS}")
 
-        tracks = set()
+        # {(artist, title): (track, scrobbles not counted yet)}
+        tracks = {}
 
         current_track = self.user.get_now_playing()
         if current_track is not None:
@@ -72,9 +156,7 @@ class User:
                 current_track.get_url(),
                 self.user,
             )
-            scrobble_count = track.get_scrobbles_count() + 1
-            if scrobble_count >= scrobbles_minimum:
-                tracks.add(track)
+            tracks[(track.artist, track.title)] = (track, 1)
 
         recent_tracks = self.user.get_recent_tracks(limit=limit)
         for recent_track in recent_tracks:
@@ -84,12 +166,26 @@ class User:
                 recent_track.track.get_url(),
                 self.user,
             )
-            scrobble_count = track.get_scrobbles_count()
-            if scrobble_count >= scrobbles_minimum:
-                tracks.add(track)
-
-        for track in tracks:
-            period_scrobbles = track.get_scrobbles_count(period)
+            tracks.setdefault((track.artist, track.title), (track, 0))
+
+        create_scrobbles_cache()
+        cached_scrobbles = load_cached_scrobbles(self.user.name, [track for track, _ in tracks.values()])
+        missing_tracks = []
+        for key, (track, _) in tracks.items():
+            if key in cached_scrobbles:
+                track._scrobbles_cache = cached_scrobbles[key]
+            else:
+                missing_tracks.append(track)
+
+        # scrobbles of each unique track are fetched concurrently, requests being spaced out by the network
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            list(executor.map(lambda track: track.scrobbles, missing_tracks))
+        save_cached_scrobbles(self.user.name, missing_tracks)
+
+        for track, pending_scrobbles in tracks.values():
             total_scrobbles = track.get_scrobbles_count()
+            if total_scrobbles + pending_scrobbles < scrobbles_minimum:
+                continue
+            period_scrobbles = track.get_scrobbles_count(period)
             url = track.get_scrobbles_url(f"LAST_{period}_DAYS")
             yield (f"{track} - {period_scrobbles} - {total_scrobbles} - {url}")
@@ -3,11 +3,14 @@ from datetime import date
 
 from spotfm import utils
 from spotfm.spotify.artist import Artist
-from spotfm.spotify.constants import MARKET
+from spotfm.spotify.constants import ALBUMS_LIMIT, MARKET
+
+# {album_id: Album}, see utils.get_cached
+_albums = {}
 
 
 class Album:
-    def __init__(self, album_id, client=None, refresh=False):
+    def __init__(self, album_id, client=None, refresh=False, update=True):
         logging.info("Initializing Album %s", album_id)
         self.id = utils.parse_url(album_id)
         self.name = None
@@ -17,7 +20,7 @@ class Album:
         self.artists = []
         # TODO: add self.tracks
 
-        if (refresh and client is not None) or (not self.update_from_db() and client is not None):
+        if update and ((refresh and client is not None) or (not self.update_from_db() and client is not None)):
             self.update_from_api(client)
             self.sync_to_db()
 
@@ -27,38 +30,109 @@ class Album:
     def __str__(self):
         return self.name
 
+    @classmethod
+    def get_album(cls, album_id, client=None, refresh=False):
+        album_id = utils.parse_url(album_id)
+        return utils.get_cached(_albums, album_id, lambda: cls(album_id, client, refresh), refresh)
+
+    # Load the albums of album_ids missing from the in-memory cache and their artists from the database
+    # with one query per table, those missing being fetched from the api by batches of ALBUMS_LIMIT when a
+    # client is given and synced in a single transaction
+    @classmethod
+    def get_albums(cls, album_ids, client=None):
+        album_ids = list(dict.fromkeys(album_ids))
+        uncached_ids = [album_id for album_id in album_ids if album_id not in _albums]
+        rows = utils.select_db_in(
+            utils.DATABASE,
+            """
+            SELECT al.id, al.name, al.release_date, al.updated_at, aa.artist_id
+            FROM albums al
+            LEFT JOIN albums_artists aa ON aa.album_id = al.id
+            WHERE al.id IN ({})
+            """,
+            uncached_ids,
+        )
+        albums = {}
+        for row in rows:
+            if row["id"] not in albums:
+                album = cls(row["id"], update=False)
+                album.name, album.release_date, album.updated = row["name"], row["release_date"], row["updated_at"]
+                albums[album.id] = album
+            if row["artist_id"] is not None:
+                albums[row["id"]].artists_id.append(row["artist_id"])
+
+        artists_id = [artist_id for album in albums.values() for artist_id in album.artists_id]
+        artists = {artist.id: artist for artist in Artist.get_artists(artists_id)}
+        for album in albums.values():
+            album.artists = [artists[id] for id in album.artists_id]
+        utils.cache_objects(_albums, albums.values())
+
+        missing_albums = {album_id: cls(album_id, update=False) for album_id in uncached_ids if album_id not in albums}
+        if client is not None and missing_albums:
+            logging.info("Fetching %s albums from api", len(missing_albums))
+            raw_albums = utils.fetch_by_batches(
+                list(missing_albums), ALBUMS_LIMIT, lambda batch: client.albums(batch, market=MARKET)["albums"]
+            )
+            updated = str(date.today())
+            fetched_albums = [missing_albums[album_id] for album_id in raw_albums]
+            for album in fetched_albums:
+                album.update_from_album(raw_albums[album.id], updated)
+
+            # artists of all the fetched albums are loaded at once
+            artists_id = [artist_id for album in fetched_albums for artist_id in album.artists_id]
+            artists = {artist.id: artist for artist in Artist.get_artists(artists_id, client)}
+            for album in fetched_albums:
+                album.artists = [artists[id] for id in album.artists_id]
+
+            logging.info("Syncing %s albums to database", len(fetched_albums))
+            utils.sync_objects(utils.DATABASE, fetched_albums)
+            utils.cache_objects(_albums, fetched_albums)
+        return [_albums.get(album_id) or missing_albums[album_id] for album_id in album_ids]
+
     def update_from_db(self):
         try:
-            self.name, self.release_date, self.updated = utils.select_db(
-                utils.DATABASE, f"SELECT name, release_date, updated_at FROM albums WHERE id == '{self.id}'"
+            self.name, self.release_date, self.updated, artists_id = utils.select_db(
+                utils.DATABASE,
+                """
+                SELECT al.name, al.release_date, al.updated_at, GROUP_CONCAT(aa.artist_id)
+                FROM albums al
+                LEFT JOIN albums_artists aa ON aa.album_id = al.id
+                WHERE al.id = ?
+                GROUP BY al.id
+                """,
+                (self.id,),
             ).fetchone()
         except TypeError:
             logging.info("Album ID %s not found in database", self.id)
             return False
-        results = utils.select_db(
-            utils.DATABASE, f"SELECT artist_id FROM albums_artists WHERE album_id == '{self.id}'"
-        ).fetchall()
-        self.artists_id = [col[0] for col in results]
-        self.artists = [Artist(id) for id in self.artists_id]
+        self.artists_id = artists_id.split(",") if artists_id else []
+        self.artists = Artist.get_artists(self.artists_id)
         logging.info("Album ID %s retrieved from database", self.id)
         return True
 
     def update_from_api(self, client):
         logging.info("Fetching album %s from api", self.id)
-        album = client.album(self.id, market=MARKET)
-        self.name = utils.sanitize_string(album["name"])
+        self.update_from_album(client.album(self.id, market=MARKET))
+        self.artists = Artist.get_artists(self.artists_id, client)
+
+    # Set the album fields from an api album object, artists being loaded by the caller
+    def update_from_album(self, album, updated=None):
+        self.name = album["name"]
         self.release_date = album["release_date"]
         self.artists_id = [artist["id"] for artist in album["artists"]]
-        self.artists = [Artist(id, client) for id in self.artists_id]
-        self.updated = str(date.today())
+        self.updated = updated or str(date.today())
+
+    def get_sync_queries(self):
+        return [
+            (
+                "INSERT OR IGNORE INTO albums VALUES (?, ?, ?, ?)",
+                (self.id, self.name, self.release_date, self.updated),
+            ),
+            ("INSERT OR IGNORE INTO albums_artists VALUES (?, ?)", [(self.id, artist.id) for artist in self.artists]),
+        ]
 
     def sync_to_db(self):
         logging.info("Syncing album %s to database", self.id)
-        queries = []
-        queries.append(
-            f"INSERT OR IGNORE INTO albums VALUES ('{self.id}', '{self.name}', '{self.release_date}', '{self.updated}')"
-        )
-        for artist in self.artists:
-            queries.append(f"INSERT OR IGNORE INTO albums_artists VALUES ('{self.id}', '{artist.id}')")
+        queries = self.get_sync_queries()
         logging.debug(queries)
         utils.query_db(utils.DATABASE, queries)
@@ -1,18 +1,23 @@
 import logging
+from collections import defaultdict
 from datetime import date
 
 from spotfm import utils
+from spotfm.spotify.constants import ARTISTS_LIMIT
+
+# {artist_id: Artist}, see utils.get_cached
+_artists = {}
 
 
 class Artist:
-    def __init__(self, artist_id, client=None, refresh=False):
+    def __init__(self, artist_id, client=None, refresh=False, update=True):
         logging.info("Initializing Artist %s", artist_id)
         self.id = utils.parse_url(artist_id)
         self.name = None
         self.genres = []
         self.updated = None
 
-        if (refresh and client is not None) or (not self.update_from_db() and client is not None):
+        if update and ((refresh and client is not None) or (not self.update_from_db() and client is not None)):
             self.update_from_api(client)
             self.sync_to_db()
 
@@ -22,16 +27,69 @@ class Artist:
     def __str__(self):
         return self.name
 
+    # Build an artist from an already fetched row with id, name and updated_at columns without querying
+    # the database
+    @classmethod
+    def from_row(cls, row, genres_by_artist):
+        def load():
+            artist = cls(row["id"], update=False)
+            artist.name, artist.updated = row["name"], row["updated_at"]
+            artist.genres = genres_by_artist.get(artist.id, [])
+            return artist
+
+        return utils.get_cached(_artists, row["id"], load)
+
+    @classmethod
+    def get_artist(cls, artist_id, client=None, refresh=False):
+        artist_id = utils.parse_url(artist_id)
+        return utils.get_cached(_artists, artist_id, lambda: cls(artist_id, client, refresh), refresh)
+
+    # Load the artists of artist_ids missing from the in-memory cache from the database with two queries,
+    # those missing being fetched from the api by batches of ARTISTS_LIMIT when a client is given and synced
+    # to the database in a single transaction
+    @classmethod
+    def get_artists(cls, artist_ids, client=None):
+        artist_ids = list(dict.fromkeys(artist_ids))
+        uncached_ids = [artist_id for artist_id in artist_ids if artist_id not in _artists]
+        rows = utils.select_db_in(
+            utils.DATABASE, "SELECT id, name, updated_at FROM artists WHERE id IN ({})", uncached_ids
+        )
+        genres_rows = utils.select_db_in(
+            utils.DATABASE, "SELECT artist_id, genre FROM artists_genres WHERE artist_id IN ({})", uncached_ids
+        )
+        genres_by_artist = defaultdict(list)
+        for artist_id, genre in genres_rows:
+            genres_by_artist[artist_id].append(genre)
+        for row in rows:
+            cls.from_row(row, genres_by_artist)
+
+        missing_artists = {
+            artist_id: cls(artist_id, update=False) for artist_id in uncached_ids if artist_id not in _artists
+        }
+        if client is not None and missing_artists:
+            logging.info("Fetching %s artists from api", len(missing_artists))
+            raw_artists = utils.fetch_by_batches(
+                list(missing_artists), ARTISTS_LIMIT, lambda batch: client.artists(batch)["artists"]
+            )
+            updated = str(date.today())
+            fetched_artists = [missing_artists[artist_id] for artist_id in raw_artists]
+            for artist in fetched_artists:
+                artist.update_from_artist(raw_artists[artist.id], updated)
+            logging.info("Syncing %s artists to database", len(fetched_artists))
+            utils.sync_objects(utils.DATABASE, fetched_artists)
+            utils.cache_objects(_artists, fetched_artists)
+        return [_artists.get(artist_id) or missing_artists[artist_id] for artist_id in artist_ids]
+
     def update_from_db(self):
         try:
             self.name, self.updated = utils.select_db(
-                utils.DATABASE, f"SELECT name, updated_at FROM artists WHERE id == '{self.id}'"
+                utils.DATABASE, "SELECT name, updated_at FROM artists WHERE id = ?", (self.id,)
             ).fetchone()
         except TypeError:
             logging.info("Artist ID %s not found in database", self.id)
             return False
         results = utils.select_db(
-            utils.DATABASE, f"SELECT genre FROM artists_genres WHERE artist_id == '{self.id}'"
+            utils.DATABASE, "SELECT genre FROM artists_genres WHERE artist_id = ?", (self.id,)
         ).fetchall()
         self.genres = [col[0] for col in results]
         logging.info("Artist ID %s retrieved from database", self.id)
@@ -39,19 +97,21 @@ class Artist:
 
     def update_from_api(self, client):
         logging.info("Fetching artist %s from api", self.id)
-        artist = client.artist(self.id)
-        self.name = utils.sanitize_string(artist["name"])
-        self.genres = [utils.sanitize_string(genre) for genre in artist["genres"]]
-        self.updated = str(date.today())
+        self.update_from_artist(client.artist(self.id))
+
+    def update_from_artist(self, artist, updated=None):
+        self.name = artist["name"]
+        self.genres = artist["genres"]
+        self.updated = updated or str(date.today())
+
+    def get_sync_queries(self):
+        return [
+            ("INSERT OR IGNORE INTO artists VALUES (?, ?, ?)", (self.id, self.name, self.updated)),
+            ("INSERT OR IGNORE INTO artists_genres VALUES (?, ?)", [(self.id, genre) for genre in self.genres]),
+        ]
 
     def sync_to_db(self):
         logging.info("Syncing artist %s to database", self.id)
-        queries = []
-        queries.append(f"INSERT OR IGNORE INTO artists VALUES ('{self.id}', '{self.name}', '{self.updated}')")
-        if len(self.genres) > 0:
-            values = ""
-            for genre in self.genres:
-                values += f"('{self.id}','{utils.sanitize_string(genre)}'),"
-            queries.append(f"INSERT OR IGNORE INTO artists_genres VALUES {values}".rstrip(","))
+        queries = self.get_sync_queries()
         logging.debug(queries)
         utils.query_db(utils.DATABASE, queries)
@@ -1,20 +1,87 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
 import spotipy
 from spotipy.oauth2 import CacheFileHandler, SpotifyOAuth
 
 from spotfm import utils
-from spotfm.spotify.constants import REDIRECT_URI, SCOPE, TOKEN_CACHE_FILE
+from spotfm.spotify.constants import (
+    MAX_RETRIES,
+    MAX_WORKERS,
+    PLAYLISTS_LIMIT,
+    REDIRECT_URI,
+    RETRY_BACKOFF,
+    RETRY_STATUSES,
+    SCOPE,
+    TOKEN_CACHE_FILE,
+    TRACKS_LIMIT,
+)
 from spotfm.spotify.playlist import Playlist
+from spotfm.spotify.track import Track
+
+PLAYLISTS_SNAPSHOTS_TABLE = """
+CREATE TABLE IF NOT EXISTS playlists_snapshots(
+  playlist_id TEXT PRIMARY KEY,
+  snapshot_id TEXT NOT NULL,
+  FOREIGN KEY (playlist_id) REFERENCES playlists (id)
+)
+"""
+
+
+# Retry-After is either a number of seconds or an HTTP date, None being returned when it can't be parsed
+def parse_retry_after(value):
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
 
-# TODO:
-# - use query params instead of f-strings
-#    (https://docs.python.org/3/library/sqlite3.html#sqlite3-placeholders)
+
+# spotipy client retrying rate limited, failing and dropped calls, waiting for the Retry-After delay given by
+# the api or a jittered exponential backoff, so a transient error doesn't abort a whole update. The thread pools
+# fetching playlists, their pages and tracks being nested, requests in flight are bounded by MAX_WORKERS here.
+class Spotify(spotipy.Spotify):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._requests_semaphore = threading.BoundedSemaphore(MAX_WORKERS)
+
+    def _internal_call(self, method, url, payload, params):
+        for attempt in range(MAX_RETRIES):
+            try:
+                with self._requests_semaphore:
+                    return super()._internal_call(method, url, payload, params)
+            except spotipy.SpotifyException as e:
+                if e.http_status not in RETRY_STATUSES or attempt == MAX_RETRIES - 1:
+                    raise
+                error, delay = e.http_status, parse_retry_after((e.headers or {}).get("Retry-After"))
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == MAX_RETRIES - 1:
+                    raise
+                error, delay = type(e).__name__, None
+            if delay is None:
+                delay = RETRY_BACKOFF * 2**attempt + random.random()
+            logging.warning("Spotify api call failed with %s, retrying in %.1f seconds", error, delay)
+            time.sleep(delay)
 
 
 class Client:
     def __init__(self, client_id, client_secret, redirect_uri=REDIRECT_URI, scope=SCOPE):
         handler = CacheFileHandler(cache_path=TOKEN_CACHE_FILE)
-        self.client = spotipy.Spotify(
-            retries=0,
+        # a plain session instead of spotipy's one, whose urllib3 retries turn rate limited and failing responses
+        # into a generic 429 error without their headers, so they reach Spotify._internal_call as they are
+        self.client = Spotify(
+            requests_session=requests.Session(),
             auth_manager=SpotifyOAuth(
                 client_id=client_id,
                 client_secret=client_secret,
@@ -23,28 +90,75 @@ class Client:
                 cache_handler=handler,
             ),
         )
+        self._user_id = None
+
+    # The current user doesn't change for the life of the client, so it is requested once
+    @property
+    def user_id(self):
+        if self._user_id is None:
+            self._user_id = self.client.current_user()["id"]
+        return self._user_id
+
+    # Return the playlists objects owned by the current user
+    def get_playlists(self, excluded_playlists=frozenset()):
+        excluded_playlists = frozenset(excluded_playlists)
+        user = self.user_id
+
+        def get_page(offset):
+            return self.client.current_user_playlists(limit=PLAYLISTS_LIMIT, offset=offset)
+
+        playlists = utils.get_all_pages(get_page, PLAYLISTS_LIMIT, MAX_WORKERS)
+        return [
+            playlist
+            for playlist in playlists
+            if playlist["owner"]["id"] == user and playlist["id"] not in excluded_playlists
+        ]
+
+    def get_playlists_id(self, excluded_playlists=frozenset()):
+        return [playlist["id"] for playlist in self.get_playlists(excluded_playlists)]
+
+    # Only playlists whose snapshot changed since the last update are fetched again. They are replaced,
+    # and playlists which no longer exist removed, in a single transaction once all of them have been
+    # fetched and their tracks synced, so the database keeps the previous playlists if the update fails midway
+    def update_playlists(self, excluded_playlists=frozenset()):
+        snapshots = {playlist["id"]: playlist["snapshot_id"] for playlist in self.get_playlists(excluded_playlists)}
+        # databases created before snapshots were tracked don't have their table yet
+        utils.query_db(utils.DATABASE, [PLAYLISTS_SNAPSHOTS_TABLE])
+        synced_snapshots = dict(
+            utils.select_db(utils.DATABASE, "SELECT playlist_id, snapshot_id FROM playlists_snapshots").fetchall()
+        )
+        synced_ids = [row[0] for row in utils.select_db(utils.DATABASE, "SELECT id FROM playlists").fetchall()]
+        changed_ids = [id for id, snapshot_id in snapshots.items() if synced_snapshots.get(id) != snapshot_id]
+        deleted_ids = changed_ids + [id for id in synced_ids if id not in snapshots]
+
+        def fetch_playlist(playlist_id):
+            return Playlist(playlist_id, self.client, sync=False)
 
-    def get_playlists_id(self, excluded_playlists=[]):
-        playlists_ids = []
-        user = self.client.current_user()["id"]
-
-        def filter_playlists(playlists):
-            for playlist in playlists["items"]:
-                if playlist["owner"]["id"] == user and playlist["id"] not in excluded_playlists:
-                    yield playlist["id"]
-
-        playlists = self.client.current_user_playlists()
-        for playlist in filter_playlists(playlists):
-            playlists_ids.append(playlist)
-        while playlists["next"]:
-            playlists = self.client.next(playlists)
-            for playlist in filter_playlists(playlists):
-                playlists_ids.append(playlist)
-
-        return playlists_ids
-
-    def update_playlists(self, excluded_playlists=[]):
-        playlists_id = self.get_playlists_id(excluded_playlists)
-        utils.query_db(utils.DATABASE, ["DELETE FROM playlists", "DELETE FROM playlists_tracks"])
-        for playlist_id in playlists_id:
-            Playlist(playlist_id, self.client)
+        # playlists are fetched concurrently while the tracks of those already fetched are looked up from this
+        # thread, by groups large enough to fill a batch per worker, tracks shared by several playlists once
+        playlists = []
+        seen_ids, pending_ids = set(), []
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            for future in as_completed([executor.submit(fetch_playlist, id) for id in changed_ids]):
+                playlist = future.result()
+                playlists.append(playlist)
+                new_ids = [track_id for track_id in dict.fromkeys(playlist.tracks_ids) if track_id not in seen_ids]
+                seen_ids.update(new_ids)
+                pending_ids.extend(new_ids)
+                if len(pending_ids) >= TRACKS_LIMIT * MAX_WORKERS:
+                    Track.get_tracks(self.client, pending_ids)
+                    pending_ids = []
+        Track.get_tracks(self.client, pending_ids)
+
+        queries = [
+            ("DELETE FROM playlists WHERE id = ?", [(id,) for id in deleted_ids]),
+            ("DELETE FROM playlists_tracks WHERE playlist_id = ?", [(id,) for id in deleted_ids]),
+            ("DELETE FROM playlists_snapshots WHERE playlist_id = ?", [(id,) for id in deleted_ids]),
+        ]
+        playlists_queries = utils.merge_queries(
+            query for playlist in playlists for query in playlist.get_sync_queries()
+        )
+        queries.extend(query for sql, rows in playlists_queries for query in utils.multi_row_insert(sql, rows))
+        queries.append(("INSERT INTO playlists_snapshots VALUES (?, ?)", [(id, snapshots[id]) for id in changed_ids]))
+        logging.info("Syncing %s playlists to database, %s unchanged", len(playlists), len(snapshots) - len(playlists))
+        utils.query_db(utils.DATABASE, queries)
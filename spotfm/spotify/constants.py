@@ -4,3 +4,12 @@ REDIRECT_URI = "http://127.0.0.1:9090"
 SCOPE = "user-library-read playlist-read-private playlist-read-collaborative"
 TOKEN_CACHE_FILE = utils.WORK_DIR / "spotify-token-cache"
 MARKET = "FR"
+PLAYLISTS_LIMIT = 50  # maximum page size of the playlists endpoints
+PLAYLIST_ITEMS_LIMIT = 100  # maximum page size of the playlist items endpoint
+TRACKS_LIMIT = 50  # maximum number of ids per request of the tracks endpoint
+ALBUMS_LIMIT = 20  # maximum number of ids per request of the albums endpoint
+ARTISTS_LIMIT = 50  # maximum number of ids per request of the artists endpoint
+MAX_WORKERS = 4
+MAX_RETRIES = 5  # attempts of a rate limited or failing api call
+RETRY_BACKOFF = 1  # seconds before the first retry when the api doesn't give a Retry-After delay
+RETRY_STATUSES = {429, 500, 502, 503, 504}
@@ -1,27 +1,29 @@
 import logging
-from collections import Counter
+from collections import Counter, defaultdict
 from datetime import date
+from functools import cached_property
 
 from spotfm import utils
-from spotfm.spotify.constants import MARKET
+from spotfm.spotify.artist import Artist
+from spotfm.spotify.constants import MARKET, MAX_WORKERS, PLAYLIST_ITEMS_LIMIT
 from spotfm.spotify.track import Track
 
 
 class Playlist:
-    def __init__(self, playlist_id, client=None, refresh=True):
+    def __init__(self, playlist_id, client=None, refresh=True, sync=True):
         self.id = utils.parse_url(playlist_id)
         logging.info("Initializing Playlist %s", self.id)
         self.name = None
         self.owner = None
         self.tracks = None  # [(id, added_at)]
         self.updated = None
-        # TODO: self._tracks
-        # TODO: self._tracks_names
-        # TODO: self._sorted_tracks
+        self._tracks = None
 
+        # with sync=False the playlist is only fetched, letting the caller sync many playlists at once
         if (refresh and client is not None) or (not self.update_from_db() and client is not None):
             self.update_from_api(client)
-            self.sync_to_db(client)
+            if sync:
+                self.sync_to_db(client)
 
     def __repr__(self):
         return f"Playlist({self.owner} - {self.name})"
@@ -29,44 +31,28 @@ class Playlist:
     def __str__(self):
         return f"{self.owner} - {self.name}"
 
-    # TODO
-    # @property
-    # def tracks(self):
-    #     if self._tracks is not None:
-    #         return self._tracks
-    #     self._tracks = []
-    #     for track_id in self.tracks_id:
-    #         self._tracks.append(Track(track_id))
-    #     return self._tracks
+    @cached_property
+    def tracks_ids(self):
+        return [track_id for track_id, _ in self.tracks]
 
-    # TODO
-    # @property
-    # def tracks_names(self):
-    #     if self._tracks_names is not None:
-    #         return self._tracks_names
-    #     self._tracks_names = []
-    #     for track in self.tracks:
-    #         self._tracks_names.append(track.__str__())
-    #     return self._tracks_names
+    @cached_property
+    def tracks_names(self):
+        return [str(track) for track in self.get_tracks()]
 
-    # TODO
-    # @property
-    # def sorted_tracks(self):
-    #     if self._sorted_tracks is not None:
-    #         return self._sorted_tracks
-    #     self._sorted_tracks = sorted(self.tracks)
-    #     return self._sorted_tracks
+    @cached_property
+    def sorted_tracks(self):
+        return sorted(self.get_tracks(), key=lambda track: track.sort_key)
 
     def update_from_db(self):
         try:
             self.name, self.owner, self.updated = utils.select_db(
-                utils.DATABASE, f"SELECT name, owner, updated_at FROM playlists WHERE id == '{self.id}'"
+                utils.DATABASE, "SELECT name, owner, updated_at FROM playlists WHERE id = ?", (self.id,)
             ).fetchone()
         except TypeError:
             logging.info("Playlist ID %s not found in database", self.id)
             return False
         results = utils.select_db(
-            utils.DATABASE, f"SELECT track_id, added_at FROM playlists_tracks WHERE playlist_id == '{self.id}'"
+            utils.DATABASE, "SELECT track_id, added_at FROM playlists_tracks WHERE playlist_id = ?", (self.id,)
         ).fetchall()
         self.tracks = [(col[0], col[1]) for col in results]
         logging.info("Playlist ID %s retrieved from database", self.id)
@@ -74,37 +60,104 @@ class Playlist:
 
     def update_from_api(self, client):
         playlist = client.playlist(self.id, fields="name,owner.id", market=MARKET)
-        self.name = utils.sanitize_string(playlist["name"])
+        self.name = playlist["name"]
         logging.info("Fetching playlist %s - %s from api", self.id, self.name)
-        self.owner = utils.sanitize_string(playlist["owner"]["id"])
-        results = client.playlist_items(
-            self.id, fields="items(added_at,track.id),next", market=MARKET, additional_types=["track"]
-        )
-        tracks = results["items"]
-        while results["next"]:
-            results = client.next(results)
-            tracks.extend(results["items"])
+        self.owner = playlist["owner"]["id"]
+
+        def get_page(offset):
+            return client.playlist_items(
+                self.id,
+                fields="items(added_at,track.id),total",
+                limit=PLAYLIST_ITEMS_LIMIT,
+                offset=offset,
+                market=MARKET,
+                additional_types=["track"],
+            )
+
+        tracks = utils.get_all_pages(get_page, PLAYLIST_ITEMS_LIMIT, MAX_WORKERS)
         self.tracks = [(track["track"]["id"], track["added_at"]) for track in tracks if track["track"] is not None]
         self.updated = str(date.today())
 
+    def get_sync_queries(self):
+        return [
+            ("INSERT OR IGNORE INTO playlists VALUES (?, ?, ?, ?)", (self.id, self.name, self.owner, self.updated)),
+            ("INSERT OR IGNORE INTO playlists_tracks VALUES (?, ?, ?)", [(self.id, *track) for track in self.tracks]),
+        ]
+
     def sync_to_db(self, client):
         logging.info("Syncing playlist %s to database", self.id)
-        queries = []
-        queries.append(
-            f"INSERT OR IGNORE INTO playlists VALUES ('{self.id}', '{self.name}', '{self.owner}', '{self.updated}')"
-        )
-        for track in self.tracks:
-            Track(track[0], client)
-            queries.append(f"INSERT OR IGNORE INTO playlists_tracks VALUES ('{self.id}', '{track[0]}', '{track[1]}')")
+        Track.get_tracks(client, self.tracks_ids)
+        queries = self.get_sync_queries()
         logging.debug(queries)
         utils.query_db(utils.DATABASE, queries)
 
+    # Load the playlist Track objects with their albums, artists and genres using one query per table
+    # instead of one set of queries per track and per artist
+    def get_tracks(self):
+        if self._tracks is not None:
+            return self._tracks
+        tracks_rows = utils.select_db(
+            utils.DATABASE,
+            """
+            SELECT t.id, t.name, t.updated_at, alt.album_id, al.name AS album, al.release_date
+            FROM playlists_tracks pt
+            JOIN tracks t ON t.id = pt.track_id
+            JOIN albums_tracks alt ON alt.track_id = t.id
+            LEFT JOIN albums al ON al.id = alt.album_id
+            WHERE pt.playlist_id = ?
+            """,
+            (self.id,),
+        ).fetchall()
+        artists_rows = utils.select_db(
+            utils.DATABASE,
+            """
+            SELECT ta.track_id, ar.id, ar.name, ar.updated_at
+            FROM playlists_tracks pt
+            JOIN tracks_artists ta ON ta.track_id = pt.track_id
+            JOIN artists ar ON ar.id = ta.artist_id
+            WHERE pt.playlist_id = ?
+            """,
+            (self.id,),
+        ).fetchall()
+        genres_rows = utils.select_db(
+            utils.DATABASE,
+            """
+            SELECT DISTINCT ag.artist_id, ag.genre
+            FROM playlists_tracks pt
+            JOIN tracks_artists ta ON ta.track_id = pt.track_id
+            JOIN artists_genres ag ON ag.artist_id = ta.artist_id
+            WHERE pt.playlist_id = ?
+            """,
+            (self.id,),
+        ).fetchall()
+
+        genres_by_artist = defaultdict(list)
+        for artist_id, genre in genres_rows:
+            genres_by_artist[artist_id].append(genre)
+        artists_by_track = defaultdict(list)
+        for row in artists_rows:
+            artists_by_track[row["track_id"]].append(Artist.from_row(row, genres_by_artist))
+        tracks = {row["id"]: Track.from_row(row, artists_by_track) for row in tracks_rows}
+
+        # tracks missing from the bulk results fall back to the per-id lookup
+        self._tracks = [tracks.get(track_id) or Track.get_track(track_id) for track_id in self.tracks_ids]
+        return self._tracks
+
+    # Count the tracks of each genre in the database rather than loading every track and artist
     def get_playlist_genres(self):
-        genres = []
-        for track in self.tracks:
-            for genre in track.genres:
-                genres.append(genre)
-        return Counter(genres)
+        results = utils.select_db(
+            utils.DATABASE,
+            """
+            SELECT ag.genre, COUNT(DISTINCT pt.track_id)
+            FROM playlists_tracks pt
+            JOIN tracks_artists ta ON ta.track_id = pt.track_id
+            JOIN artists_genres ag ON ag.artist_id = ta.artist_id
+            WHERE pt.playlist_id = ?
+            GROUP BY ag.genre
+            """,
+            (self.id,),
+        ).fetchall()
+        return Counter(dict(results))
 
     # TODO
     # def remove_track(self, track_id):
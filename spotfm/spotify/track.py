@@ -1,10 +1,17 @@
 import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
+from functools import cached_property
+from itertools import chain
 
 from spotfm import utils
 from spotfm.spotify.album import Album
 from spotfm.spotify.artist import Artist
-from spotfm.spotify.constants import MARKET
+from spotfm.spotify.constants import MARKET, MAX_WORKERS, TRACKS_LIMIT
+
+# {track_id: Track}, see utils.get_cached
+_tracks = {}
 
 
 class Track:
@@ -25,92 +32,197 @@ class Track:
             self.sync_to_db(client)
 
     def __repr__(self):
-        artists_names = [artist.name for artist in self.artists]
-        return f"Track({', '.join(artists_names)} - {self.name})"
+        return f"Track({self.artists_names} - {self.name})"
 
     def __str__(self):
-        artists_names = [artist.name for artist in self.artists]
-        return f"{', '.join(artists_names)} - {self.name}"
+        return f"{self.artists_names} - {self.name}"
 
     def __lt__(self, other):
-        return self.__repr__() < other.__repr__()
+        return self.sort_key < other.sort_key
+
+    # Tracks are identified by their id, so copies of a track loaded separately compare and hash equal
+    def __eq__(self, other):
+        if not isinstance(other, Track):
+            return NotImplemented
+        return self.id == other.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    # Build a track from an already fetched row with id, name, updated_at, album_id, album and release_date
+    # columns without querying the database
+    @classmethod
+    def from_row(cls, row, artists_by_track):
+        def load():
+            track = cls(row["id"], update=False)
+            track.name, track.updated = row["name"], row["updated_at"]
+            track.album_id, track.album, track.release_date = row["album_id"], row["album"], row["release_date"]
+            track.artists = artists_by_track.get(track.id, [])
+            track.artists_id = [artist.id for artist in track.artists]
+            return track
+
+        return utils.get_cached(_tracks, row["id"], load)
+
+    @classmethod
+    def get_track(cls, track_id, client=None, refresh=False):
+        track_id = utils.parse_url(track_id)
+        return utils.get_cached(_tracks, track_id, lambda: cls(track_id, client, refresh), refresh)
+
+    # Load the tracks of track_ids with their albums and artists from the database with one query per table
+    # into the in-memory cache
+    @classmethod
+    def load_tracks(cls, track_ids):
+        rows = utils.select_db_in(
+            utils.DATABASE,
+            """
+            SELECT t.id, t.name, t.updated_at, alt.album_id, al.name AS album, al.release_date
+            FROM tracks t
+            JOIN albums_tracks alt ON alt.track_id = t.id
+            LEFT JOIN albums al ON al.id = alt.album_id
+            WHERE t.id IN ({})
+            """,
+            track_ids,
+        )
+        artists_rows = utils.select_db_in(
+            utils.DATABASE, "SELECT track_id, artist_id FROM tracks_artists WHERE track_id IN ({})", track_ids
+        )
+        artists = {artist.id: artist for artist in Artist.get_artists([row["artist_id"] for row in artists_rows])}
+        artists_by_track = defaultdict(list)
+        for row in artists_rows:
+            artists_by_track[row["track_id"]].append(artists[row["artist_id"]])
+        for row in rows:
+            cls.from_row(row, artists_by_track)
+
+    # Return the tracks of track_ids, those missing from the in-memory cache being loaded from the database
+    # in bulk and those missing from the database being fetched from the api by batches of TRACKS_LIMIT
+    # instead of one request per track
+    @classmethod
+    def get_tracks(cls, client, track_ids, refresh=False):
+        tracks = {}
+        track_ids = list(dict.fromkeys(utils.parse_url(track_id) for track_id in track_ids))
+        if refresh:
+            missing_ids = track_ids
+        else:
+            cls.load_tracks([track_id for track_id in track_ids if track_id not in _tracks])
+            tracks.update((track_id, _tracks[track_id]) for track_id in track_ids if track_id in _tracks)
+            missing_ids = [track_id for track_id in track_ids if track_id not in _tracks]
+
+        def fetch_batch(batch):
+            logging.info("Fetching %s tracks from api", len(batch))
+            return client.tracks(batch, market=MARKET)
+
+        # batches are fetched concurrently while the results are synced to the database from this thread
+        batches = [missing_ids[i : i + TRACKS_LIMIT] for i in range(0, len(missing_ids), TRACKS_LIMIT)]
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            for batch, results in zip(batches, executor.map(fetch_batch, batches)):
+                # albums and artists of the batch missing from the database are synced upfront in one go
+                raw_tracks = [raw_track for raw_track in results["tracks"] if raw_track]
+                Album.get_albums([raw_track["album"]["id"] for raw_track in raw_tracks], client)
+                artists_id = [artist["id"] for raw_track in raw_tracks for artist in raw_track["artists"]]
+                Artist.get_artists(artists_id, client)
+                # results are in the same order as the requested ids, which may differ from the returned ones
+                # when a track is relinked for the market
+                batch_tracks = []
+                updated = str(date.today())
+                for track_id, raw_track in zip(batch, results["tracks"]):
+                    if raw_track is None:
+                        logging.info("Track ID %s not found", track_id)
+                        continue
+                    track = cls(track_id, update=False)
+                    track.update_from_track(raw_track, client, updated)
+                    batch_tracks.append(track)
+                    tracks[track_id] = track
+                logging.info("Syncing %s tracks to database", len(batch_tracks))
+                utils.sync_objects(utils.DATABASE, batch_tracks)
+                utils.cache_objects(_tracks, batch_tracks)
+
+        return list(tracks.values())
+
+    @property
+    def artists(self):
+        return self._artists
+
+    # Values derived from the artists are computed again once they are set, a track built with update=False
+    # being printed or sorted before its artists are loaded
+    @artists.setter
+    def artists(self, artists):
+        self._artists = artists
+        self._genres = None
+        self.__dict__.pop("artists_names", None)
+        self.__dict__.pop("sort_key", None)
+
+    # Computed once per track as it is used by __str__, __repr__ and sort_key
+    @cached_property
+    def artists_names(self):
+        return ", ".join(artist.name for artist in self.artists or [])
+
+    # Computed once per track so sorting doesn't rebuild the artists names on every comparison
+    @cached_property
+    def sort_key(self):
+        return (self.artists_names.lower(), (self.name or "").lower())
 
     @property
     def genres(self):
         if self._genres is not None:
             return self._genres
-        genres = []
-        for artist in self.artists:
-            for genre in artist.genres:
-                genres.append(genre)
-        self._genres = list(dict.fromkeys(genres))
+        self._genres = list(dict.fromkeys(chain.from_iterable(artist.genres for artist in self.artists)))
         return self._genres
 
     def update_from_db(self):
+        # track, album and artists ids are fetched with a single query
         try:
-            self.name, self.updated = utils.select_db(
-                utils.DATABASE, f"SELECT name, updated_at FROM tracks WHERE id == '{self.id}'"
+            self.name, self.updated, self.album_id, self.album, self.release_date, artists_id = utils.select_db(
+                utils.DATABASE,
+                """
+                SELECT t.name, t.updated_at, alt.album_id, al.name, al.release_date, GROUP_CONCAT(DISTINCT ta.artist_id)
+                FROM tracks t
+                JOIN albums_tracks alt ON alt.track_id = t.id
+                LEFT JOIN albums al ON al.id = alt.album_id
+                LEFT JOIN tracks_artists ta ON ta.track_id = t.id
+                WHERE t.id = ?
+                GROUP BY t.id
+                """,
+                (self.id,),
             ).fetchone()
         except TypeError:
             logging.info("Track ID %s not found in database", self.id)
             return False
-        try:
-            self.album_id = utils.select_db(
-                utils.DATABASE, f"SELECT album_id FROM albums_tracks WHERE track_id == '{self.id}'"
-            ).fetchone()[0]
-        except TypeError:
-            logging.info("Album ID %s not found in database", self.id)
-            return False
-        album = Album(self.album_id)
-        # TODO: add Album object instead
-        self.album = album.name
-        self.release_date = album.release_date
-        results = utils.select_db(
-            utils.DATABASE, f"SELECT artist_id FROM tracks_artists WHERE track_id == '{self.id}'"
-        ).fetchall()
-        self.artists_id = [col[0] for col in results]
-        self.artists = [Artist(id) for id in self.artists_id]
+        self.artists_id = artists_id.split(",") if artists_id else []
+        self.artists = Artist.get_artists(self.artists_id)
         logging.info("Track ID %s retrieved from database", self.id)
         return True
 
     def update_from_api(self, client):
         logging.info("Fetching track %s from api", self.id)
-        track = client.track(self.id, market=MARKET)
-        self.name = utils.sanitize_string(track["name"])
-        self.album_id = track["album"]["id"]
-        album = Album(self.album_id)
-        self.album = album.name
-        self.release_date = album.release_date
-        self.artists_id = [artist["id"] for artist in track["artists"]]
-        self.artists = [Artist(id, client) for id in self.artists_id]
-        self.updated = str(date.today())
+        self.update_from_track(client.track(self.id, market=MARKET), client)
 
-    def update_from_track(self, track, client):
-        self.name = utils.sanitize_string(track["name"])
+    # updated can be given by callers updating many tracks at once to compute the date once
+    def update_from_track(self, track, client, updated=None):
+        self.name = track["name"]
         self.album_id = track["album"]["id"]
-        album = Album(self.album_id)
+        album = Album.get_album(self.album_id, client)
         self.album = album.name
         self.release_date = album.release_date
         self.artists_id = [artist["id"] for artist in track["artists"]]
-        self.artists = [Artist(id, client) for id in self.artists_id]
-        self.updated = str(date.today())
+        self.artists = [Artist.get_artist(id, client) for id in self.artists_id]
+        self.updated = updated or str(date.today())
+
+    def get_sync_queries(self):
+        return [
+            ("INSERT OR IGNORE INTO tracks VALUES (?, ?, ?)", (self.id, self.name, self.updated)),
+            ("INSERT OR IGNORE INTO albums_tracks VALUES (?, ?)", (self.album_id, self.id)),
+            ("INSERT OR IGNORE INTO tracks_artists VALUES (?, ?)", [(self.id, artist.id) for artist in self.artists]),
+        ]
 
     def sync_to_db(self, client):
         logging.info("Syncing track %s to database", self.id)
-        Album(self.album_id, client)
-        queries = []
-        queries.append(f"INSERT OR IGNORE INTO tracks VALUES ('{self.id}', '{self.name}', '{self.updated}')")
-        queries.append(f"INSERT OR IGNORE INTO albums_tracks VALUES ('{self.album_id}', '{self.id}')")
-        for artist in self.artists:
-            queries.append(f"INSERT OR IGNORE INTO tracks_artists VALUES ('{self.id}', '{artist.id}')")
+        Album.get_album(self.album_id, client)
+        queries = self.get_sync_queries()
         logging.debug(queries)
         utils.query_db(utils.DATABASE, queries)
 
     def get_artists_names(self):
-        artists_names = []
-        for artist in self.artists:
-            artists_names.append(artist.name)
-        return ", ".join(artists_names)
+        return self.artists_names
 
     def get_genres_names(self):
         return ", ".join(self.genres)
@@ -1,7 +1,10 @@
 import logging
+import re
 import sqlite3
 import time
 import tomllib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 from urllib.parse import urlparse
@@ -12,17 +15,33 @@ CACHE_DIR = WORK_DIR / "cache"
 CONFIG_FILE = WORK_DIR / "spotfm.toml"
 DATABASE = WORK_DIR / "spotify.db"
 DATABASE_LOG_LEVEL = logging.debug
+# WAL with synchronous=NORMAL only syncs to disk on checkpoints instead of every commit,
+# and a 64MB page cache with 256MB of memory mapped I/O keep the database pages in memory
+DATABASE_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA mmap_size=268435456",
+]
+SQLITE_MAX_VARIABLES = 999
+# prepared statements kept per connection, IN (...) lookups adding one statement per chunk length
+SQLITE_CACHED_STATEMENTS = 512
 
+SPOTIFY_ID_RE = re.compile(r"[A-Za-z0-9]{22}")
 
-def get_date():
-    return datetime.today().strftime("%Y%m%d")
+# {database: sqlite3.Connection}
+_connections = {}
 
 
-def sanitize_string(string):
-    return string.replace("'", "")
+def get_date():
+    return datetime.today().strftime("%Y%m%d")
 
 
+# Return the id of a Spotify url, plain ids being returned as is without parsing them as urls
 def parse_url(url):
+    if SPOTIFY_ID_RE.fullmatch(url):
+        return url
     return urlparse(url).path.split("/")[-1]
 
 
@@ -32,27 +51,145 @@ def parse_config(file=CONFIG_FILE):
     return config
 
 
+# Return a connection kept open for the whole execution, so sqlite statement cache and
+# page cache are reused across queries instead of reconnecting each time.
+# Database reads and writes must all happen on the main thread, worker threads only calling the apis. sqlite3
+# check_same_thread is kept on so a query issued from a worker raises instead of interleaving with a transaction.
+def get_connection(database):
+    con = _connections.get(database)
+    if con is None:
+        con = sqlite3.connect(database, cached_statements=SQLITE_CACHED_STATEMENTS)
+        con.set_trace_callback(DATABASE_LOG_LEVEL)
+        # rows can still be unpacked like tuples, but bulk queries read their columns by name
+        con.row_factory = sqlite3.Row
+        for pragma in DATABASE_PRAGMAS:
+            con.execute(pragma)
+        _connections[database] = con
+    return con
+
+
+def close_connections():
+    for con in _connections.values():
+        con.close()
+    _connections.clear()
+
+
+# queries items are either plain SQL strings or (sql, params) tuples, params being
+# a tuple for a single execution or a list of tuples for executemany.
+# All queries run in a single transaction which is rolled back if one of them fails. It is opened explicitly
+# as sqlite3 only opens one implicitly before DML statements, which would commit DDL statements on their own.
+# Scripts run outside of it, executescript committing any pending transaction first.
 def query_db(database, queries, script=False):
-    con = sqlite3.connect(database)
-    con.set_trace_callback(DATABASE_LOG_LEVEL)
-    cur = con.cursor()
-    for query in queries:
-        if script:
-            cur.executescript(query)
-        else:
-            cur.execute(query)
-    con.commit()
-    con.close()
+    con = get_connection(database)
+    with con:
+        cur = con.cursor()
+        if not script:
+            cur.execute("BEGIN")
+        for query in queries:
+            if script:
+                cur.executescript(query)
+            elif isinstance(query, str):
+                cur.execute(query)
+            else:
+                sql, params = query
+                if isinstance(params, list):
+                    cur.executemany(sql, params)
+                else:
+                    cur.execute(sql, params)
     # spare CPU load
     time.sleep(0.01)
 
 
+# Merge the (sql, params) queries running the same statement into a single executemany query,
+# keeping the order in which each statement first appears
+def merge_queries(queries):
+    rows = defaultdict(list)
+    for sql, params in queries:
+        if isinstance(params, list):
+            rows[sql].extend(params)
+        else:
+            rows[sql].append(params)
+    return list(rows.items())
+
+
+# Turn a single row "INSERT ... VALUES (?, ...)" statement and its rows into multi-row VALUES statements
+# binding up to SQLITE_MAX_VARIABLES parameters each, sqlite running them faster than one execution per row
+def multi_row_insert(sql, rows):
+    if not rows:
+        return []
+    statement, _, values = sql.partition(" VALUES ")
+    chunk_size = SQLITE_MAX_VARIABLES // len(rows[0])
+    queries = []
+    for i in range(0, len(rows), chunk_size):
+        chunk = rows[i : i + chunk_size]
+        params = tuple(value for row in chunk for value in row)
+        queries.append((f"{statement} VALUES {', '.join([values] * len(chunk))}", params))
+    return queries
+
+
 def select_db(database, query, params=""):
-    con = sqlite3.connect(database)
-    con.set_trace_callback(DATABASE_LOG_LEVEL)
-    cur = con.cursor()
-    res = cur.execute(query, params)
-    return res
+    return get_connection(database).execute(query, params)
+
+
+# Run a query with a {} placeholder for an IN (...) list over all ids, splitting them in chunks
+# to stay under sqlite limit of bound parameters per statement
+def select_db_in(database, query, ids):
+    results = []
+    for i in range(0, len(ids), SQLITE_MAX_VARIABLES):
+        chunk = ids[i : i + SQLITE_MAX_VARIABLES]
+        results.extend(select_db(database, query.format(", ".join("?" * len(chunk))), chunk).fetchall())
+    return results
+
+
+# Return the object of key from cache, an in-memory cache of the objects loaded during this execution so each
+# one is read from the database once, building it with load on first access or when refresh is set. Only
+# objects which were loaded, their updated date being set, are cached, so placeholders of objects missing
+# from the database and the api are tried again by later accesses.
+def get_cached(cache, key, load, refresh=False):
+    obj = cache.get(key)
+    if not refresh and obj is not None and obj.updated is not None:
+        return obj
+    obj = load()
+    cache_objects(cache, [obj])
+    return obj
+
+
+# Add the loaded objects to cache, see get_cached
+def cache_objects(cache, objects):
+    cache.update((obj.id, obj) for obj in objects if obj.updated is not None)
+
+
+# Return {id: raw object} of ids fetched from an api endpoint taking up to limit ids per request, fetch_batch
+# returning the objects in the order of the requested ids with None for those not found, which are left out
+def fetch_by_batches(ids, limit, fetch_batch):
+    raw_objects = {}
+    for i in range(0, len(ids), limit):
+        batch = ids[i : i + limit]
+        for object_id, raw_object in zip(batch, fetch_batch(batch)):
+            if raw_object is None:
+                logging.info("ID %s not found", object_id)
+                continue
+            raw_objects[object_id] = raw_object
+    return raw_objects
+
+
+# Sync objects with a get_sync_queries method to the database in a single transaction, running each
+# statement once for all of them
+def sync_objects(database, objects):
+    queries = merge_queries(query for obj in objects for query in obj.get_sync_queries())
+    query_db(database, queries)
+
+
+# Return the items of every page of an offset paginated api endpoint. The first page gives the total,
+# so the remaining pages are fetched concurrently by offset instead of following each page next url.
+def get_all_pages(get_page, limit, max_workers):
+    page = get_page(0)
+    items = page["items"]
+    offsets = range(limit, page["total"], limit)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for page in executor.map(get_page, offsets):
+            items.extend(page["items"])
+    return items
 
 
 # Parse a file with track ids and return a list of track ids
@@ -0,0 +1,112 @@
+import threading
+from collections import Counter
+from pathlib import Path
+
+import pytest
+
+from spotfm import utils
+from spotfm.spotify import album, artist, track
+
+CREATE_TABLES_SCRIPT = Path(__file__).parent.parent / "hacks" / "create-tables.sql"
+
+
+# Fake spotipy client serving generated playlists, tracks, albums and artists and recording the api calls
+class FakeSpotify:
+    def __init__(self, playlists=5, playlist_tracks=130):
+        self.playlists = playlists
+        self.playlist_tracks = playlist_tracks
+        self.snapshots = {}  # {playlist_id: version}
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _log(self, *call):
+        with self._lock:
+            self.calls.append(call)
+
+    def count(self):
+        return Counter(call[0] for call in self.calls)
+
+    def current_user(self):
+        self._log("current_user")
+        return {"id": "me"}
+
+    def current_user_playlists(self, limit=50, offset=0):
+        self._log("current_user_playlists", offset)
+        items = [
+            {"id": f"p{i}", "snapshot_id": f"p{i}-{self.snapshots.get(f'p{i}', 0)}", "owner": {"id": "me"}}
+            for i in range(offset, min(offset + limit, self.playlists))
+        ]
+        return {"items": items, "total": self.playlists}
+
+    def playlist(self, playlist_id, fields=None, market=None):
+        self._log("playlist", playlist_id)
+        return {"name": f"Playlist {playlist_id}", "owner": {"id": "me"}}
+
+    def playlist_items(self, playlist_id, fields=None, limit=100, offset=0, market=None, additional_types=None):
+        self._log("playlist_items", playlist_id, offset)
+        start = int(playlist_id[1:])
+        items = [
+            {"added_at": "2020-01-01", "track": {"id": f"t{(i + start) % 200}"}}
+            for i in range(offset, min(offset + limit, self.playlist_tracks))
+        ]
+        return {"items": items, "total": self.playlist_tracks}
+
+    def _track(self, track_id):
+        i = int(track_id[1:])
+        return {
+            "id": track_id,
+            "name": f"Track {i}",
+            "album": {"id": f"al{i % 40}"},
+            "artists": [{"id": f"ar{i % 25}"}, {"id": f"ar{(i + 1) % 25}"}],
+        }
+
+    def track(self, track_id, market=None):
+        self._log("track", track_id)
+        return self._track(track_id)
+
+    def tracks(self, track_ids, market=None):
+        self._log("tracks", len(track_ids))
+        assert len(track_ids) <= 50
+        return {"tracks": [self._track(track_id) if track_id != "missing" else None for track_id in track_ids]}
+
+    def _album(self, album_id):
+        i = int(album_id[2:])
+        return {"id": album_id, "name": f"Album {i}", "release_date": "2001", "artists": [{"id": f"ar{i % 25}"}]}
+
+    def album(self, album_id, market=None):
+        self._log("album", album_id)
+        return self._album(album_id)
+
+    def albums(self, album_ids, market=None):
+        self._log("albums", len(album_ids))
+        assert len(album_ids) <= 20
+        return {"albums": [self._album(album_id) for album_id in album_ids]}
+
+    def _artist(self, artist_id):
+        i = int(artist_id[2:])
+        return {"id": artist_id, "name": f"Artist {i}", "genres": [f"genre {i % 5}"]}
+
+    def artist(self, artist_id):
+        self._log("artist", artist_id)
+        return self._artist(artist_id)
+
+    def artists(self, artist_ids):
+        self._log("artists", len(artist_ids))
+        assert len(artist_ids) <= 50
+        return {"artists": [self._artist(artist_id) for artist_id in artist_ids]}
+
+
+# Every test gets its own database with the tables created and empty in-memory caches
+@pytest.fixture(autouse=True)
+def database(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "DATABASE", tmp_path / "spotify.db")
+    utils.query_db(utils.DATABASE, [CREATE_TABLES_SCRIPT.read_text()], script=True)
+    for cache in (track._tracks, album._albums, artist._artists):
+        cache.clear()
+    yield utils.DATABASE
+    utils.close_connections()
+
+
+@pytest.fixture
+def fake_spotify():
+    return FakeSpotify()
@@ -0,0 +1,104 @@
+import pytest
+
+spotipy = pytest.importorskip("spotipy")
+requests = pytest.importorskip("requests")
+
+from spotfm import utils  # noqa: E402
+from spotfm.spotify import client as spotify_client  # noqa: E402
+from spotfm.spotify.constants import MAX_RETRIES  # noqa: E402
+
+
+@pytest.fixture
+def client(fake_spotify):
+    client = spotify_client.Client("client_id", "client_secret")
+    client.client = fake_spotify
+    return client
+
+
+def count_rows(table):
+    return utils.select_db(utils.DATABASE, f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_update_playlists_skips_unchanged_snapshots(client, fake_spotify):
+    client.update_playlists(["p4"])
+    assert count_rows("playlists") == 4
+    assert count_rows("playlists_snapshots") == 4
+    assert count_rows("playlists_tracks") == 4 * 130
+
+    fake_spotify.calls.clear()
+    fake_spotify.snapshots["p2"] = 1
+    client.update_playlists(["p3", "p4"])
+
+    calls = fake_spotify.count()
+    assert [call for call in fake_spotify.calls if call[0] == "playlist"] == [("playlist", "p2")]
+    assert calls["tracks"] == 0
+    assert dict(utils.select_db(utils.DATABASE, "SELECT * FROM playlists_snapshots").fetchall()) == {
+        "p0": "p0-0",
+        "p1": "p1-0",
+        "p2": "p2-1",
+    }
+    assert count_rows("playlists") == 3
+    assert count_rows("playlists_tracks") == 3 * 130
+
+
+def test_update_playlists_creates_snapshots_table(client):
+    utils.query_db(utils.DATABASE, ["DROP TABLE playlists_snapshots"])
+    client.update_playlists()
+    assert count_rows("playlists_snapshots") == 5
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [(None, None), ("3", 3.0), ("-1", 0.0), ("Thu, 01 Jan 1970 00:00:00 GMT", 0.0), ("soon", None)],
+)
+def test_parse_retry_after(value, expected):
+    assert spotify_client.parse_retry_after(value) == expected
+
+
+@pytest.fixture
+def internal_calls(monkeypatch):
+    responses = []
+    sleeps = []
+
+    def internal_call(self, method, url, payload, params):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    monkeypatch.setattr(spotipy.Spotify, "_internal_call", internal_call)
+    monkeypatch.setattr(spotify_client.time, "sleep", sleeps.append)
+    return responses, sleeps
+
+
+def test_internal_call_retries(internal_calls):
+    responses, sleeps = internal_calls
+    responses.extend(
+        [
+            spotipy.SpotifyException(429, -1, "rate limited", headers={"Retry-After": "7"}),
+            spotipy.SpotifyException(503, -1, "unavailable"),
+            requests.ConnectionError(),
+            requests.Timeout(),
+            {"id": "t1"},
+        ]
+    )
+    assert spotify_client.Spotify(auth="token")._internal_call("GET", "tracks/t1", None, {}) == {"id": "t1"}
+    assert responses == []
+    assert len(sleeps) == 4
+    assert sleeps[0] == 7
+
+
+def test_internal_call_raises_client_errors(internal_calls):
+    responses, sleeps = internal_calls
+    responses.append(spotipy.SpotifyException(404, -1, "not found"))
+    with pytest.raises(spotipy.SpotifyException):
+        spotify_client.Spotify(auth="token")._internal_call("GET", "tracks/t1", None, {})
+    assert sleeps == []
+
+
+def test_internal_call_gives_up(internal_calls):
+    responses, sleeps = internal_calls
+    responses.extend([spotipy.SpotifyException(500, -1, "error")] * MAX_RETRIES)
+    with pytest.raises(spotipy.SpotifyException):
+        spotify_client.Spotify(auth="token")._internal_call("GET", "tracks/t1", None, {})
+    assert len(sleeps) == MAX_RETRIES - 1
@@ -0,0 +1,89 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pylast")
+
+from spotfm import lastfm  # noqa: E402
+
+
+# Fake pylast user with a now playing track, recent tracks and their scrobbles, recording the tracks whose
+# scrobbles are requested
+class FakeUser:
+    def __init__(self, name, scrobbles):
+        self.name = name
+        self.scrobbles = scrobbles  # {(artist, title): [timestamp]}
+        self.calls = []
+
+    @staticmethod
+    def _track(artist, title):
+        return SimpleNamespace(
+            artist=SimpleNamespace(name=artist),
+            title=title,
+            get_url=lambda: f"{lastfm.LASTFM_BASE_URL}/music/{artist}/_/{title}",
+        )
+
+    def get_now_playing(self):
+        return self._track("a", "now")
+
+    def get_recent_tracks(self, limit):
+        return [SimpleNamespace(track=self._track(artist, title)) for artist, title in self.scrobbles]
+
+    def get_track_scrobbles(self, artist, title):
+        self.calls.append((artist, title))
+        return [SimpleNamespace(timestamp=str(timestamp)) for timestamp in self.scrobbles[(artist, title)]]
+
+
+@pytest.fixture(autouse=True)
+def scrobbles_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(lastfm, "SCROBBLES_CACHE", tmp_path / "cache" / "scrobbles.db")
+
+
+def get_user(name):
+    now = int(time.time())
+    scrobbles = {
+        ("a", "now"): [now - 10, now - 20],
+        ("a", "old"): [now - 10, now - 30 * lastfm.SECONDS_PER_DAY],
+        ("b", "once"): [now - 10],
+    }
+    user = FakeUser(name, scrobbles)
+    return lastfm.User(SimpleNamespace(get_authenticated_user=lambda: user)), user
+
+
+def test_get_recent_tracks_scrobbles():
+    user, fake_user = get_user("me")
+    results = list(user.get_recent_tracks_scrobbles(scrobbles_minimum=2, period=7))
+
+    assert results == [
+        "a - now - 2 - 2 - https://www.last.fm/user/me/library/music/a/_/now?date_preset=LAST_7_DAYS",
+        "a - old - 1 - 2 - https://www.last.fm/user/me/library/music/a/_/old?date_preset=LAST_7_DAYS",
+    ]
+    assert sorted(fake_user.calls) == [("a", "now"), ("a", "old"), ("b", "once")]
+
+
+def test_scrobbles_are_cached_per_user():
+    user, fake_user = get_user("me")
+    first = list(user.get_recent_tracks_scrobbles(period=7))
+    fake_user.calls.clear()
+    assert list(user.get_recent_tracks_scrobbles(period=7)) == first
+    assert fake_user.calls == []
+
+    other_user, other_fake_user = get_user("other")
+    list(other_user.get_recent_tracks_scrobbles(period=7))
+    assert len(other_fake_user.calls) == 3
+
+
+def test_expired_scrobbles_are_fetched_again(monkeypatch):
+    user, fake_user = get_user("me")
+    list(user.get_recent_tracks_scrobbles(period=7))
+    fake_user.calls.clear()
+    monkeypatch.setattr(lastfm, "SCROBBLES_CACHE_TTL", -1)
+    list(user.get_recent_tracks_scrobbles(period=7))
+    assert len(fake_user.calls) == 3
+
+
+def test_unknown_period():
+    user, _ = get_user("me")
+    with pytest.raises(lastfm.UnknownPeriodError):
+        list(user.get_recent_tracks_scrobbles(period=8))
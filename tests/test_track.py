@@ -0,0 +1,61 @@
+from spotfm import utils
+from spotfm.spotify import track
+from spotfm.spotify.artist import Artist
+from spotfm.spotify.track import Track
+
+
+def test_get_tracks_fetches_by_batches(fake_spotify):
+    track_ids = [f"t{i}" for i in range(120)]
+    tracks = Track.get_tracks(fake_spotify, track_ids + track_ids[:10])
+
+    assert [t.id for t in tracks] == track_ids
+    calls = fake_spotify.count()
+    # 120 tracks in batches of 50, 40 albums in batches of 20 and 25 artists in a single batch
+    assert calls["tracks"] == 3
+    assert calls["albums"] == 2
+    assert calls["artists"] == 1
+    assert not {"track", "album", "artist"} & set(calls)
+    assert utils.select_db(utils.DATABASE, "SELECT COUNT(*) FROM tracks").fetchone()[0] == 120
+    assert utils.select_db(utils.DATABASE, "SELECT COUNT(*) FROM tracks_artists").fetchone()[0] == 240
+
+
+def test_get_tracks_loads_from_database(fake_spotify):
+    track_ids = [f"t{i}" for i in range(60)]
+    Track.get_tracks(fake_spotify, track_ids)
+    track._tracks.clear()
+    fake_spotify.calls.clear()
+
+    statements = []
+    utils.get_connection(utils.DATABASE).set_trace_callback(statements.append)
+    tracks = Track.get_tracks(fake_spotify, track_ids)
+
+    assert fake_spotify.calls == []
+    assert [t.id for t in tracks] == track_ids
+    assert str(tracks[1]) == "Artist 1, Artist 2 - Track 1"
+    assert tracks[1].album == "Album 1"
+    # tracks and their artists are read with one query per table instead of one per track
+    assert len(statements) < 10
+
+
+def test_get_tracks_skips_missing_tracks(fake_spotify):
+    tracks = Track.get_tracks(fake_spotify, ["t1", "missing"])
+
+    assert [t.id for t in tracks] == ["t1"]
+    assert "missing" not in track._tracks
+
+
+def test_get_track_doesnt_cache_missing_tracks():
+    assert Track.get_track("t1").updated is None
+    assert "t1" not in track._tracks
+
+
+def test_artists_names_follow_artists():
+    t = Track("t1", update=False)
+    t.name = "Track 1"
+    assert str(t) == " - Track 1"
+
+    artist = Artist("ar1", update=False)
+    artist.name = "Artist 1"
+    t.artists = [artist]
+    assert str(t) == "Artist 1 - Track 1"
+    assert t.sort_key == ("artist 1", "track 1")
@@ -0,0 +1,76 @@
+import sqlite3
+
+import pytest
+
+from spotfm import utils
+
+
+def test_parse_url():
+    assert utils.parse_url("https://open.spotify.com/track/6rqhFgbbKwnb9MLmUQDhG6?si=1") == "6rqhFgbbKwnb9MLmUQDhG6"
+    assert utils.parse_url("6rqhFgbbKwnb9MLmUQDhG6") == "6rqhFgbbKwnb9MLmUQDhG6"
+
+
+def test_merge_queries():
+    queries = [
+        ("INSERT INTO a VALUES (?)", (1,)),
+        ("INSERT INTO b VALUES (?)", [(2,), (3,)]),
+        ("INSERT INTO a VALUES (?)", [(4,)]),
+    ]
+    assert utils.merge_queries(queries) == [
+        ("INSERT INTO a VALUES (?)", [(1,), (4,)]),
+        ("INSERT INTO b VALUES (?)", [(2,), (3,)]),
+    ]
+
+
+def test_multi_row_insert(monkeypatch):
+    monkeypatch.setattr(utils, "SQLITE_MAX_VARIABLES", 6)
+    rows = [(i, f"name {i}") for i in range(7)]
+    queries = utils.multi_row_insert("INSERT INTO t VALUES (?, ?)", rows)
+    assert queries == [
+        ("INSERT INTO t VALUES (?, ?), (?, ?), (?, ?)", (0, "name 0", 1, "name 1", 2, "name 2")),
+        ("INSERT INTO t VALUES (?, ?), (?, ?), (?, ?)", (3, "name 3", 4, "name 4", 5, "name 5")),
+        ("INSERT INTO t VALUES (?, ?)", (6, "name 6")),
+    ]
+    assert utils.multi_row_insert("INSERT INTO t VALUES (?, ?)", []) == []
+
+
+def test_multi_row_insert_writes_every_row(database):
+    rows = [(f"t{i}", f"Track {i}", "2020-01-01") for i in range(1000)]
+    utils.query_db(database, utils.multi_row_insert("INSERT INTO tracks VALUES (?, ?, ?)", rows))
+    assert [tuple(row) for row in utils.select_db(database, "SELECT * FROM tracks ORDER BY rowid")] == rows
+
+
+def test_select_db_in_chunks(database, monkeypatch):
+    rows = [(f"ar{i}", f"Artist {i}", "2020-01-01") for i in range(10)]
+    utils.query_db(database, [("INSERT INTO artists VALUES (?, ?, ?)", rows)])
+    monkeypatch.setattr(utils, "SQLITE_MAX_VARIABLES", 3)
+    statements = []
+    utils.get_connection(database).set_trace_callback(statements.append)
+    ids = [f"ar{i}" for i in range(8)] + ["unknown"]
+    rows = utils.select_db_in(database, "SELECT id FROM artists WHERE id IN ({})", ids)
+    assert sorted(row["id"] for row in rows) == ids[:-1]
+    assert len(statements) == 3
+    assert utils.select_db_in(database, "SELECT id FROM artists WHERE id IN ({})", []) == []
+
+
+def test_query_db_rolls_back_every_query(database):
+    queries = [
+        "CREATE TABLE extra(id TEXT)",
+        ("INSERT INTO tracks VALUES (?, ?, ?)", ("t1", "Track 1", "2020-01-01")),
+        ("INSERT INTO missing VALUES (?)", ("t1",)),
+    ]
+    with pytest.raises(sqlite3.OperationalError):
+        utils.query_db(database, queries)
+    assert utils.select_db(database, "SELECT COUNT(*) FROM tracks").fetchone()[0] == 0
+    assert utils.select_db(database, "SELECT name FROM sqlite_master WHERE name = 'extra'").fetchone() is None
+
+
+def test_get_all_pages():
+    offsets = []
+
+    def get_page(offset):
+        offsets.append(offset)
+        return {"items": list(range(offset, min(offset + 10, 35))), "total": 35}
+
+    assert utils.get_all_pages(get_page, 10, 4) == list(range(35))
+    assert sorted(offsets) == [0, 10, 20, 30]